@@ -0,0 +1,15 @@
+# Optional numba support: import njit from here so the bot still runs
+# (just slower) on deployments where numba is not installed.
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # no-op decorator, works both bare (@njit) and with options (@njit(...))
+        if args and callable(args[0]):
+            return args[0]
+        def wrap(func):
+            return func
+        return wrap
@@ -1,15 +1,15 @@
-import os, sys, asyncio, csv, io, math, random
-from datetime import datetime, timezone
+import os, sys, asyncio, collections, gzip, math, random, shutil, time
 from dotenv import load_dotenv
 import aiohttp
-import pandas as pd
 import numpy as np
 
 from aiogram import Bot, Dispatcher
 from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, BufferedInputFile
 from aiogram import F
 
+from indicators import _rsi_ma
+
 # load local .env if present (Render uses environment variables)
 load_dotenv()
 
@@ -18,16 +18,80 @@ ALPHAVANTAGE_API_KEY = os.getenv('ALPHAVANTAGE_API_KEY', '').strip()
 FX_DEFAULT = os.getenv('FX_DEFAULT', 'EUR/USD')
 
 # available pairs list (AlphaVantage expects from_symbol and to_symbol)
-PAIRS = [
+PAIRS: tuple[str, ...] = (
     'EUR/USD', 'GBP/USD', 'USD/JPY', 'USD/CHF', 'USD/CAD', 'AUD/USD'
-]
+)
+
+# base/quote symbols per pair, split once instead of per request
+_SPLIT_CACHE = {p: tuple(p.split('/')) for p in PAIRS}
+
+# callback_data -> pair, frozen at import so selection is one dict lookup
+_CALLBACK_TO_PAIR = {f"pair_{p.replace('/', '_')}": p for p in PAIRS}
+
+# keyboards are static, build them once at import instead of per callback
+START_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text='📊 Получить рандомный сигнал', callback_data='get_random')],
+    [InlineKeyboardButton(text='🔁 Выбрать и запомнить пару', callback_data='choose_pair')],
+    [InlineKeyboardButton(text='📁 Получить логи', callback_data='get_logs')],
+])
+CHOOSE_PAIR_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=pair, callback_data=cb)]
+    for cb, pair in _CALLBACK_TO_PAIR.items()
+])
 
 # simple CSV log path
 LOG_CSV = 'signals_log.csv'
 if not os.path.exists(LOG_CSV):
     with open(LOG_CSV, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['time_utc','chat_id','pair','direction','price','horizon_min','strength','rsi','ma5','ma14'])
+        f.write('time_utc,chat_id,pair,direction,price,horizon_min,strength,rsi,ma5,ma14\n')
+
+# one persistent buffered handle instead of open/append/close per signal;
+# a background task flushes + fsyncs so N signals share one disk sync
+LOG_FH = open(LOG_CSV, 'a', buffering=1 << 16, newline='', encoding='utf-8')
+
+# no field here can contain a comma or newline, so skip csv.writer quoting
+# and format the whole row in one go
+_ROW_FMT = '{},{},{},{},{:.6f},{},{},{:.4f},{:.6f},{:.6f}\n'
+
+# compressed copy of the log for uploads; rebuilt only when the CSV changed
+LOG_GZ = LOG_CSV + '.gz'
+_LOG_GZ_MTIME = 0.0
+
+def _gzip_log():
+    # level 1 is enough: CSV compresses ~4-10x and stays fast on big logs
+    with open(LOG_CSV, 'rb') as src, gzip.open(LOG_GZ, 'wb', compresslevel=1) as dst:
+        shutil.copyfileobj(src, dst)
+
+async def _refresh_log_gz():
+    global _LOG_GZ_MTIME
+    mtime = os.path.getmtime(LOG_CSV)
+    if mtime != _LOG_GZ_MTIME or not os.path.exists(LOG_GZ):
+        # compress in a thread so a large log doesn't stall the loop
+        await asyncio.to_thread(_gzip_log)
+        _LOG_GZ_MTIME = mtime
+
+# the quick log view only needs recent rows, so read a bounded tail
+_LOG_TAIL_BYTES = 64 * 1024
+
+def _read_log_tail():
+    with open(LOG_CSV, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(0, size - _LOG_TAIL_BYTES))
+        buf = f.read()
+    if size > _LOG_TAIL_BYTES:
+        # drop the partial first line left by seeking mid-row
+        buf = buf[buf.find(b'\n') + 1:]
+    return buf
+
+def _flush_log():
+    LOG_FH.flush()
+    os.fsync(LOG_FH.fileno())
+
+async def _log_flusher():
+    while True:
+        await asyncio.sleep(5)
+        # fsync can block for milliseconds on a busy disk; keep it off the loop
+        await asyncio.to_thread(_flush_log)
 
 # safety checks
 if not TELEGRAM_BOT_TOKEN:
@@ -42,14 +106,36 @@ print('✅ TELEGRAM token length:', len(TELEGRAM_BOT_TOKEN), flush=True)
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
 dp = Dispatcher()
 
+# shared HTTP session (created in main, reused for all AlphaVantage calls)
+SESSION: aiohttp.ClientSession | None = None
+
+# 1-min bars only change once per minute, so cache responses per (pair, minute bucket);
+# per-key locks coalesce concurrent callbacks onto a single in-flight request
+_FX_CACHE: dict[tuple[str, str], tuple[int, tuple]] = {}
+_FX_LOCKS: dict[tuple[str, str], asyncio.Lock] = {}
+
+# per-pair incremental indicator state: the EWM RSI only needs its two running
+# averages and the MAs only the last 14 closes, so after one full-history pass
+# each new bar is folded in online instead of recomputing everything
+_RSI_ALPHA = 2.0 / 15.0  # matches ewm(span=14, adjust=False)
+PAIR_STATE: dict[str, dict] = {}
+
 # user state: remember selected pair per chat
 user_pair = {}  # chat_id -> pair string like 'EUR/USD'
 
-def split_pair(pair_str):
-    base, quote = pair_str.split('/')
-    return base.strip(), quote.strip()
-
 async def fetch_fx_intraday_csv(from_symbol, to_symbol, api_key, interval='1min'):
+    key = (from_symbol, to_symbol)
+    bucket = int(time.time() // 60)
+    lock = _FX_LOCKS.setdefault(key, asyncio.Lock())
+    async with lock:
+        cached = _FX_CACHE.get(key)
+        if cached is not None and cached[0] == bucket:
+            return cached[1]
+        data = await _fetch_fx_intraday_csv(from_symbol, to_symbol, api_key, interval)
+        _FX_CACHE[key] = (bucket, data)
+        return data
+
+async def _fetch_fx_intraday_csv(from_symbol, to_symbol, api_key, interval='1min'):
     url = 'https://www.alphavantage.co/query'
     params = {
         'function': 'FX_INTRADAY',
@@ -60,90 +146,109 @@ async def fetch_fx_intraday_csv(from_symbol, to_symbol, api_key, interval='1min'
         'outputsize': 'compact',
         'apikey': api_key
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params, timeout=30) as resp:
-            text = await resp.text()
-            if text.strip().startswith('{') or 'Note' in text or 'Error' in text:
-                raise RuntimeError('AlphaVantage error or rate limit: ' + text[:200])
-            df = pd.read_csv(io.StringIO(text))
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df.sort_values('timestamp', inplace=True)
-            return df
-
-def compute_indicators_from_series(close_series):
-    # close_series: pandas Series sorted by time ascending
-    close = close_series.astype(float)
-    ma5 = close.rolling(window=5).mean().iloc[-1] if len(close) >=5 else float('nan')
-    ma14 = close.rolling(window=14).mean().iloc[-1] if len(close) >=14 else float('nan')
-    # RSI
-    delta = close.diff().dropna()
-    if len(delta) < 1:
-        rsi_val = float('nan')
-    else:
-        up = delta.clip(lower=0)
-        down = -1 * delta.clip(upper=0)
-        roll_up = up.ewm(span=14, adjust=False).mean()
-        roll_down = down.ewm(span=14, adjust=False).mean()
-        rs = roll_up / (roll_down.replace(0, float('nan')))
-        rsi = 100 - (100 / (1 + rs))
-        rsi_val = float(rsi.iloc[-1]) if not rsi.isna().all() else float('nan')
-    return rsi_val, float(ma5) if not math.isnan(ma5) else float('nan'), float(ma14) if not math.isnan(ma14) else float('nan')
+    async with SESSION.get(url, params=params, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+        text = await resp.text()
+        # error bodies are small JSON and a CSV body starts with its header, so
+        # checking the first 1 KB avoids stripping/scanning the whole response
+        head = text[:1024]
+        if head.lstrip()[:1] in ('{', '<') or 'Note' in head or 'Error Message' in head:
+            raise RuntimeError('AlphaVantage error or rate limit: ' + text[:200])
+        # we only need the timestamp and close columns; pull closes into float64
+        rows = text.splitlines()
+        header = rows[0].split(',')
+        close_idx = header.index('close')
+        # compact output is newest-first; the indicators need at most 14 closes
+        # plus warmup, so keep only the 20 newest rows and reverse to ascending
+        stamps = []
+        closes = []
+        for r in reversed(rows[1:21]):
+            fields = r.split(',')
+            try:
+                close = float(fields[close_idx])
+            except (ValueError, IndexError):
+                # AlphaVantage occasionally emits '.' or empty fields; drop the bar
+                continue
+            stamps.append(fields[0])
+            closes.append(close)
+        return stamps, np.asarray(closes, dtype=np.float64)
+
+def compute_indicators_from_series(closes):
+    # closes: float64 ndarray sorted by time ascending
+    close = np.ascontiguousarray(closes, dtype=np.float64)
+    rsi, ma5, ma14, _, _ = _rsi_ma(close)
+    return float(rsi), float(ma5), float(ma14)
+
+def update_pair_state(pair, stamps, closes):
+    # fold fetched bars into the pair's running state and return
+    # (rsi, ma5, ma14, last_price); only bars newer than last_ts are processed
+    state = PAIR_STATE.get(pair)
+    if state is None or math.isnan(state['roll_up']):
+        # first sight of this pair: one full kernel pass seeds the EWM state
+        arr = np.ascontiguousarray(closes, dtype=np.float64)
+        rsi, ma5, ma14, roll_up, roll_down = _rsi_ma(arr)
+        PAIR_STATE[pair] = {
+            'last_ts': stamps[-1],
+            'closes': collections.deque(closes, maxlen=20),
+            'roll_up': float(roll_up),
+            'roll_down': float(roll_down),
+        }
+        return float(rsi), float(ma5), float(ma14), float(closes[-1])
+    dq = state['closes']
+    last_ts = state['last_ts']
+    roll_up = state['roll_up']
+    roll_down = state['roll_down']
+    prev = dq[-1]
+    for ts, close in zip(stamps, closes):
+        if ts <= last_ts:
+            continue
+        delta = close - prev
+        up = delta if delta > 0.0 else 0.0
+        down = -delta if delta < 0.0 else 0.0
+        roll_up = (1.0 - _RSI_ALPHA) * roll_up + _RSI_ALPHA * up
+        roll_down = (1.0 - _RSI_ALPHA) * roll_down + _RSI_ALPHA * down
+        dq.append(close)
+        prev = close
+        last_ts = ts
+    state['last_ts'] = last_ts
+    state['roll_up'] = roll_up
+    state['roll_down'] = roll_down
+    tail = list(dq)
+    ma5 = sum(tail[-5:]) / 5.0 if len(tail) >= 5 else float('nan')
+    ma14 = sum(tail[-14:]) / 14.0 if len(tail) >= 14 else float('nan')
+    rsi = float('nan') if roll_down == 0.0 else 100.0 - 100.0 / (1.0 + roll_up / roll_down)
+    return rsi, ma5, ma14, float(tail[-1])
+
+# determine_signal folded into a lookup table: row = RSI bucket, column = MA
+# trend (down/flat/up), entry = (direction, strength, horizon) codes. The old
+# if-ladder used `rsi < 25/35` but `rsi > 65/75`, so the upper two bin edges are
+# bumped by one ulp to keep rsi == 65/75 in the lower bucket under side='right'.
+_RSI_BINS = np.array([25.0, 35.0, np.nextafter(65.0, np.inf), np.nextafter(75.0, np.inf)])
+_DIRECTIONS = ('NEUTRAL', 'BUY', 'SELL')
+_STRENGTHS = ('low', 'medium', 'high')
+_RULES = np.array([
+    # down        flat        up
+    [[1, 2, 5], [1, 2, 5], [1, 2, 5]],   # rsi < 25: strong BUY
+    [[1, 1, 3], [1, 1, 3], [1, 2, 4]],   # 25..35: BUY, upgraded on MA confirmation
+    [[2, 0, 2], [0, 0, 2], [1, 0, 2]],   # 35..65: fall back to MA trend
+    [[2, 2, 4], [2, 1, 3], [2, 1, 3]],   # 65..75: SELL, upgraded on MA confirmation
+    [[2, 2, 5], [2, 2, 5], [2, 2, 5]],   # rsi > 75: strong SELL
+], dtype=np.int64)
 
 def determine_signal(rsi, ma5, ma14, last_close):
-    # Determine direction by RSI and MA crossover, and strength
-    direction = None
-    strength = 'low'
-    horizon = 2  # default minutes
-    # MA trend
-    if not math.isnan(ma5) and not math.isnan(ma14):
-        if ma5 > ma14:
-            ma_trend = 'up'
-        elif ma5 < ma14:
-            ma_trend = 'down'
-        else:
-            ma_trend = 'flat'
-    else:
-        ma_trend = 'flat'
-    # RSI rules
-    if not math.isnan(rsi):
-        if rsi < 25:
-            direction = 'BUY'
-            strength = 'high'
-            horizon = 5
-        elif rsi < 35:
-            direction = 'BUY'
-            strength = 'medium'
-            horizon = 3
-        elif rsi > 75:
-            direction = 'SELL'
-            strength = 'high'
-            horizon = 5
-        elif rsi > 65:
-            direction = 'SELL'
-            strength = 'medium'
-            horizon = 3
-    # MA confirmation
-    if direction == 'BUY' and ma_trend == 'up':
-        if strength == 'low':
-            strength = 'medium'; horizon = 3
-        elif strength == 'medium':
-            strength = 'high'; horizon = max(horizon,4)
-    if direction == 'SELL' and ma_trend == 'down':
-        if strength == 'low':
-            strength = 'medium'; horizon = 3
-        elif strength == 'medium':
-            strength = 'high'; horizon = max(horizon,4)
-    # fallback: if no RSI signal, use MA trend
-    if direction is None and ma_trend != 'flat':
-        direction = 'BUY' if ma_trend == 'up' else 'SELL'
-        strength = 'low'
-        horizon = 2
-    # if still none, neutral
-    if direction is None:
-        direction = 'NEUTRAL'
-        strength = 'low'
-        horizon = 2
-    return direction, strength, int(horizon)
+    # nan RSI lands in the neutral band, nan MAs count as a flat trend
+    bucket = 2 if math.isnan(rsi) else int(np.searchsorted(_RSI_BINS, rsi, side='right'))
+    trend = 0 if math.isnan(ma5) or math.isnan(ma14) else (ma5 > ma14) - (ma5 < ma14)
+    d, s, horizon = _RULES[bucket, trend + 1]
+    return _DIRECTIONS[d], _STRENGTHS[s], int(horizon)
+
+async def get_signal(pair):
+    # fetch + indicators + rules for one pair; safe to run many concurrently,
+    # the shared session keeps the parallel fetches on pooled connections
+    base, quote = _SPLIT_CACHE[pair]
+    stamps, closes = await fetch_fx_intraday_csv(base, quote, ALPHAVANTAGE_API_KEY)
+    rsi, ma5, ma14, last_price = update_pair_state(pair, stamps, closes)
+    direction, strength, horizon = determine_signal(rsi, ma5, ma14, last_price)
+    return rsi, ma5, ma14, last_price, direction, strength, horizon
 
 def format_signal_message(pair, direction, price, horizon, strength, rsi, ma5, ma14):
     emoji = '🔼' if direction == 'BUY' else ('🔽' if direction == 'SELL' else '⚪️')
@@ -157,12 +262,7 @@ def format_signal_message(pair, direction, price, horizon, strength, rsi, ma5, m
 
 @dp.message(Command('start'))
 async def cmd_start(message: Message):
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text='📊 Получить рандомный сигнал', callback_data='get_random')],
-        [InlineKeyboardButton(text='🔁 Выбрать и запомнить пару', callback_data='choose_pair')],
-        [InlineKeyboardButton(text='📁 Получить логи', callback_data='get_logs')],
-    ])
-    await message.answer('Привет! Нажми, чтобы получить сигнал (рандомная пара) или выбрать пару для запоминания.', reply_markup=kb)
+    await message.answer('Привет! Нажми, чтобы получить сигнал (рандомная пара) или выбрать пару для запоминания.', reply_markup=START_KB)
 
 @dp.callback_query(F.data == 'get_random')
 async def cb_get_random(call):
@@ -171,51 +271,92 @@ async def cb_get_random(call):
     user_pair[chat_id] = pair  # remember chosen random pair
     await call.message.answer(f'Выбрана пара: {pair} — собираю данные...')
     try:
-        base, quote = split_pair(pair)
-        df = await fetch_fx_intraday_csv(base, quote, ALPHAVANTAGE_API_KEY)
-        # use last up to 30 minutes of 1-min bars (AlphaVantage compact gives last 100)
-        closes = df['close'].astype(float)
-        rsi, ma5, ma14 = compute_indicators_from_series(closes)
-        last_price = float(closes.iloc[-1])
-        direction, strength, horizon = determine_signal(rsi, ma5, ma14, last_price)
+        rsi, ma5, ma14, last_price, direction, strength, horizon = await get_signal(pair)
         msg = format_signal_message(pair, direction, last_price, horizon, strength, rsi if not math.isnan(rsi) else 0.0, ma5 if not math.isnan(ma5) else 0.0, ma14 if not math.isnan(ma14) else 0.0)
         await call.message.answer(msg)
         # log
-        with open(LOG_CSV, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([datetime.utcnow().isoformat(), chat_id, pair, direction, f'{last_price:.6f}', horizon, strength, f'{rsi:.4f}', f'{ma5:.6f}', f'{ma14:.6f}'])
+        ts = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        LOG_FH.write(_ROW_FMT.format(ts, chat_id, pair, direction, last_price, horizon, strength, rsi, ma5, ma14))
     except Exception as e:
         await call.message.answer(f'Ошибка при получении данных: {e}')
 
-@dp.callback_query(lambda c: c.data == "choose_pair")
-async def choose_pair(call: types.CallbackQuery):
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=p, callback_data=f"pair_{p.replace('/', '_')}")]
-            for p in PAIRS
-        ]
-    )
-    await call.message.answer("Выбери пару для запоминания:", reply_markup=kb)
+@dp.message(Command('scan'))
+async def cmd_scan(message: Message):
+    await message.answer('Сканирую все пары...')
+    # all fetches run concurrently on the pooled session, so wall time is
+    # roughly one round trip instead of six
+    results = await asyncio.gather(*(get_signal(p) for p in PAIRS), return_exceptions=True)
+    lines = []
+    for pair, res in zip(PAIRS, results):
+        if isinstance(res, BaseException):
+            lines.append(f'⚠️ {pair}: ошибка ({res})')
+            continue
+        rsi, ma5, ma14, last_price, direction, strength, horizon = res
+        emoji = '🔼' if direction == 'BUY' else ('🔽' if direction == 'SELL' else '⚪️')
+        lines.append(f'{emoji} {pair}: {direction} ({strength}, {horizon} мин) @ {last_price:.5f}')
+    await message.answer('\n'.join(lines))
+
+@dp.callback_query(F.data == 'choose_pair')
+async def choose_pair(call):
+    await call.message.answer("Выбери пару для запоминания:", reply_markup=CHOOSE_PAIR_KB)
 
-@dp.callback_query(lambda c: c.data and c.data.startswith('pair_'))
+@dp.callback_query(F.data.in_(_CALLBACK_TO_PAIR))
 async def cb_pair_selected(call):
     chat_id = call.message.chat.id
-    pair = call.data.replace('pair_', '').replace('_','/')
+    pair = _CALLBACK_TO_PAIR[call.data]
     user_pair[chat_id] = pair
     await call.message.answer(f'Пара {pair} сохранена. Теперь по кнопке будет использоваться она.')
 
 @dp.callback_query(F.data == 'get_logs')
 async def cb_get_logs(call):
     if os.path.exists(LOG_CSV):
-        await call.message.answer_document(open(LOG_CSV, 'rb'))
+        LOG_FH.flush()  # make buffered rows visible before reading
+        # bounded tail keeps the upload size flat however big the log grows;
+        # /logs full still sends the whole file compressed
+        buf = _read_log_tail()
+        await call.message.answer_document(BufferedInputFile(buf, filename='signals_tail.csv'))
     else:
         await call.message.answer('Логов пока нет.')
 
+@dp.message(Command('logs'))
+async def cmd_logs(message: Message):
+    if not os.path.exists(LOG_CSV):
+        await message.answer('Логов пока нет.')
+        return
+    LOG_FH.flush()
+    args = (message.text or '').split()
+    if len(args) > 1 and args[1] == 'full':
+        await _refresh_log_gz()
+        # FSInputFile streams the file asynchronously instead of blocking the loop
+        await message.answer_document(FSInputFile(LOG_GZ))
+    else:
+        await message.answer_document(BufferedInputFile(_read_log_tail(), filename='signals_tail.csv'))
+
 async def main():
+    global SESSION
+    SESSION = aiohttp.ClientSession(
+        # limit_per_host covers all 6 pairs fetched concurrently (see /scan)
+        connector=aiohttp.TCPConnector(limit=20, limit_per_host=6, ttl_dns_cache=300, keepalive_timeout=60)
+    )
+    # warm the JIT cache now so the first signal doesn't pay the compile cost
+    _rsi_ma(np.zeros(20, dtype=np.float64))
+    flusher = asyncio.create_task(_log_flusher())
     print('🚀 Bot started polling', flush=True)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        flusher.cancel()
+        LOG_FH.flush()
+        LOG_FH.close()
+        await SESSION.close()
 
 if __name__ == '__main__':
+    try:
+        # libuv event loop: faster socket/timer plumbing for aiogram + aiohttp
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
@@ -1 +1,68 @@
-pass
+import numpy as np
+
+from _njit import njit, HAVE_NUMBA
+
+# explicit signature skips type inference on first call; cache=True keeps the
+# compiled object on disk so restarts don't recompile
+@njit("UniTuple(float64, 5)(float64[::1])", cache=True)
+def _rsi_ma(close):
+    # close: float64 ndarray sorted by time ascending
+    # returns (rsi, ma5, ma14, roll_up, roll_down), nan where not enough bars;
+    # roll_up/roll_down are the running EWM averages so callers can keep
+    # updating the RSI online without reprocessing history
+    n = close.shape[0]
+    ma5 = close[n - 5:].mean() if n >= 5 else np.nan
+    ma14 = close[n - 14:].mean() if n >= 14 else np.nan
+    rsi = np.nan
+    roll_up = np.nan
+    roll_down = np.nan
+    if n >= 2:
+        # Wilder-style RSI matching ewm(span=14, adjust=False) on the deltas
+        alpha = 2.0 / 15.0
+        delta = close[1] - close[0]
+        roll_up = delta if delta > 0.0 else 0.0
+        roll_down = -delta if delta < 0.0 else 0.0
+        for i in range(2, n):
+            delta = close[i] - close[i - 1]
+            up = delta if delta > 0.0 else 0.0
+            down = -delta if delta < 0.0 else 0.0
+            roll_up = (1.0 - alpha) * roll_up + alpha * up
+            roll_down = (1.0 - alpha) * roll_down + alpha * down
+        if roll_down != 0.0:
+            rs = roll_up / roll_down
+            rsi = 100.0 - 100.0 / (1.0 + rs)
+    return rsi, ma5, ma14, roll_up, roll_down
+
+if not HAVE_NUMBA:
+    # without numba the loop above runs as plain Python; prefer a vectorized
+    # scipy.signal.lfilter implementation of the same EWM recurrence when
+    # scipy is around, and keep the loop as the last-resort fallback
+    try:
+        from scipy.signal import lfilter
+    except ImportError:
+        lfilter = None
+
+    if lfilter is not None:
+        _ALPHA = 2.0 / 15.0
+
+        def _rsi_ma(close):
+            n = close.shape[0]
+            ma5 = close[n - 5:].mean() if n >= 5 else np.nan
+            ma14 = close[n - 14:].mean() if n >= 14 else np.nan
+            rsi = np.nan
+            roll_up = np.nan
+            roll_down = np.nan
+            if n >= 2:
+                delta = np.diff(close)
+                up = np.clip(delta, 0.0, None)
+                down = np.clip(-delta, 0.0, None)
+                b = [_ALPHA]
+                a = [1.0, _ALPHA - 1.0]
+                # zi seeds the recurrence so y[0] == x[0], matching adjust=False
+                ru, _ = lfilter(b, a, up, zi=np.array([(1.0 - _ALPHA) * up[0]]))
+                rd, _ = lfilter(b, a, down, zi=np.array([(1.0 - _ALPHA) * down[0]]))
+                roll_up = ru[-1]
+                roll_down = rd[-1]
+                if roll_down != 0.0:
+                    rsi = 100.0 - 100.0 / (1.0 + roll_up / roll_down)
+            return rsi, ma5, ma14, roll_up, roll_down